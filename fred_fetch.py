@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+fred_fetch.py
+
+Shared FRED client for personal_inflation.py and personal_inflation_fred_plus.py:
+annual means of BLS "Average Price" series, fetched concurrently over one pooled
+session and cached on disk for years FRED has finished publishing.
+
+Usage:
+  from fred_fetch import fetch_all
+  avgs = fetch_all(["APU0000708111"], [2000, 2024], key)   # {sid: {year: avg}}
+"""
+
+import os
+import json
+import time
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API = "https://api.stlouisfed.org/fred/series/observations"
+
+# Cap on concurrent requests to FRED, and a deadline (seconds) for the whole batch.
+# Each request's timeout is clamped so all its attempts (RETRIES + 1, plus BACKOFF_RESERVE
+# for retry sleeps) fit in the time left before the deadline, so the batch as a whole,
+# in however many waves of MAX_WORKERS, ends by TOTAL_TIMEOUT. Timeouts are per socket
+# operation, so a server trickling bytes can still stretch a single read.
+MAX_WORKERS = 8
+TOTAL_TIMEOUT = 60
+REQUEST_TIMEOUT = 15
+RETRIES = 2
+BACKOFF_RESERVE = 1.0
+
+# Annual means of final years never change; keep them on disk between runs.
+# A year counts as final from this (month, day) of the following year.
+FINAL_AFTER = (3, 1)
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "fred_toolkit", "observations.json")
+
+def make_session() -> requests.Session:
+    """Keep-alive session with one pooled connection per worker, retrying transient errors."""
+    session = requests.Session()
+    # Retry-After is ignored so a 429 can't sleep past the batch deadline
+    retry = Retry(total=RETRIES, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                  respect_retry_after_header=False)
+    session.mount("https://", HTTPAdapter(pool_maxsize=MAX_WORKERS, max_retries=retry))
+    return session
+
+def year_avgs(series_id: str, years: List[int], key: str, session: requests.Session,
+              deadline: Optional[float] = None) -> Dict[int, float]:
+    """
+    Annual means for every year in [min(years), max(years)], in one request.
+    With a time.monotonic() deadline, the request (and its retries) must finish by it.
+    """
+    timeout = REQUEST_TIMEOUT
+    if deadline is not None:
+        left = deadline - time.monotonic() - BACKOFF_RESERVE
+        if left <= 0:
+            raise TimeoutError(f"FRED requests did not finish within {TOTAL_TIMEOUT}s")
+        timeout = min(timeout, left / (RETRIES + 1))
+    clamped = timeout < REQUEST_TIMEOUT
+    params = {
+        "series_id": series_id,
+        "api_key": key,
+        "file_type": "json",
+        "observation_start": f"{min(years)}-01-01",
+        "observation_end": f"{max(years)}-12-31",
+        "frequency": "a",
+        "aggregation_method": "avg",
+        "units": "lin",
+    }
+    try:
+        r = session.get(API, params=params, timeout=timeout)
+    except (requests.Timeout, requests.ConnectionError) as e:
+        if clamped:  # ran out of batch time, not just a slow request
+            raise TimeoutError(f"FRED requests did not finish within {TOTAL_TIMEOUT}s") from e
+        raise
+    r.raise_for_status()
+    avgs = {}
+    for o in orjson.loads(r.content)["observations"]:
+        v = o["value"]
+        if v not in ("", "."):
+            avgs[int(o["date"][:4])] = float(v)
+    return avgs
+
+def load_cache() -> Dict[str, Optional[float]]:
+    try:
+        with open(CACHE_PATH, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache: Dict[str, Optional[float]]) -> None:
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    tmp = f"{CACHE_PATH}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(cache, fh, indent=1, sort_keys=True)
+    os.replace(tmp, CACHE_PATH)
+
+def is_final(year: int, today: dt.date) -> bool:
+    """A year's annual mean is final once FRED has December (BLS publishes it mid-January)."""
+    return today >= dt.date(year + 1, *FINAL_AFTER)
+
+def cached_year_avgs(series_id: str, years: List[int], key: str, session: requests.Session,
+                     cache: Dict[str, Optional[float]], deadline: Optional[float] = None) -> Dict[int, float]:
+    """
+    year_avgs, served from the on-disk cache when every requested year is final.
+    A final year FRED has no observation for, but with later years present, is a
+    real gap and is cached as None (read back as NaN).
+    """
+    today = dt.date.today()
+    keys = {y: f"{series_id}:{y}" for y in years}
+    missing = [y for y in years if not (is_final(y, today) and keys[y] in cache)]
+    if missing:
+        # Only span the years we don't already have
+        avgs = year_avgs(series_id, missing, key, session, deadline)
+        last = max(avgs, default=None)
+        for y in range(min(missing), max(missing) + 1):
+            if not is_final(y, today):
+                continue
+            if y in avgs:
+                cache[f"{series_id}:{y}"] = avgs[y]
+            elif last is not None and y < last:
+                cache[f"{series_id}:{y}"] = None
+    else:
+        avgs = {}
+    out = {}
+    for y in years:
+        v = avgs.get(y) if y in missing else cache[keys[y]]
+        out[y] = float("nan") if v is None else v
+    return out
+
+def fetch_all(sids: List[str], years: List[int], key: str) -> Dict[str, Dict[int, float]]:
+    """
+    Batch fetch: {sid: {year: avg}} for every series, one request each, run concurrently
+    over a single shared session. Raises TimeoutError if the batch overruns TOTAL_TIMEOUT;
+    whatever did arrive is still saved to the cache.
+    """
+    cache = load_cache()
+    cached = len(cache)
+    deadline = time.monotonic() + TOTAL_TIMEOUT
+    try:
+        with make_session() as session, ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+            results = ex.map(lambda sid: cached_year_avgs(sid, years, key, session, cache, deadline), sids)
+            try:
+                avgs = dict(zip(sids, results))
+            finally:
+                ex.shutdown(cancel_futures=True)  # drop queued jobs; in-flight ones end by the deadline
+    finally:
+        if len(cache) != cached:
+            save_cache(cache)
+    return avgs
@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
-import os, sys, csv, math, datetime as dt
-import requests
+import os, sys, csv, math
+from fred_fetch import fetch_all
 
-API = "https://api.stlouisfed.org/fred/series/observations"
 KEY = os.environ.get("FRED_API_KEY")
 if not KEY:
     sys.exit("Set FRED_API_KEY in your environment")
@@ -28,27 +27,17 @@ SERIES = {
 
 YEARS = [2000, 2024]
 
-def year_avg(series_id, year):
-    params = {
-        "series_id": series_id,
-        "api_key": KEY,
-        "file_type": "json",
-        "observation_start": f"{year}-01-01",
-        "observation_end": f"{year}-12-31",
-        "frequency": "m",  # monthly
-        "units": "lin",
-    }
-    r = requests.get(API, params=params, timeout=30)
-    r.raise_for_status()
-    obs = [float(o["value"]) for o in r.json()["observations"] if o["value"] not in ("", ".")]
-    return sum(obs)/len(obs) if obs else math.nan
-
 def main():
+    try:
+        avgs = fetch_all([sid for (_, sid) in SERIES.values()], YEARS, KEY)
+    except TimeoutError as e:
+        sys.exit(str(e))
+
     w = csv.writer(sys.stdout)
     w.writerow(["item","unit","year_2000","year_2024","source"])
     for item,(unit,sid) in SERIES.items():
-        y2000 = year_avg(sid, 2000)
-        y2024 = year_avg(sid, 2024)
+        y2000 = avgs[sid][2000]
+        y2024 = avgs[sid][2024]
         src = f"BLS Average Price series via FRED ({sid}); annual mean of monthly"
         w.writerow([item, unit,
                     f"{y2000:.3f}" if not math.isnan(y2000) else "",
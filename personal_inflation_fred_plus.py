@@ -18,23 +18,21 @@ Usage:
 
 import os
 import sys
-import csv
 import math
 import json
+import re
 import argparse
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Dict, Tuple, List
 
-import requests
+import numpy as np
+import pandas as pd
 
-# Plotting (only used when --plot is set)
-import matplotlib
-matplotlib.use("Agg")  # headless
-import matplotlib.pyplot as plt
+from fred_fetch import fetch_all
 
-API = "https://api.stlouisfed.org/fred/series/observations"
-
-# Map item -> (unit, FRED series id)
-SERIES = {
+# Map item -> (unit, FRED series id); categorized into SERIES below
+_RAW_SERIES = {
     # Food at home
     "Bread (white, pan)": ("lb", "APU0000702111"),
     "Chicken breast, boneless": ("lb", "APU0000FF1101"),
@@ -60,14 +58,34 @@ CATEGORY_KEYWORDS = [
     ("transport_fuel", ["gasoline"]),
 ]
 
+# One compiled alternation per category, checked in CATEGORY_KEYWORDS order
+_CATEGORY_RES = [(cat, re.compile("|".join(map(re.escape, needles)))) for cat, needles in CATEGORY_KEYWORDS]
+
+@lru_cache(maxsize=None)
 def categorize_item(name: str) -> str:
     n = (name or "").lower()
-    for cat, needles in CATEGORY_KEYWORDS:
-        for needle in needles:
-            if needle in n:
-                return cat
+    for cat, rx in _CATEGORY_RES:
+        if rx.search(n):
+            return cat
     return "unclassified"  # won’t be used in weighted calc
 
+# Fixed integer id per category
+CATEGORIES = [cat for cat, _ in CATEGORY_KEYWORDS] + ["unclassified"]
+CAT_ID = {cat: i for i, cat in enumerate(CATEGORIES)}
+
+@dataclass(frozen=True)
+class Series:
+    """One basket item: display unit, FRED series id, and CAT_ID category."""
+    __slots__ = ("unit", "sid", "cat")  # dataclass(slots=True) needs 3.10
+    unit: str
+    sid: str
+    cat: int
+
+# Map item -> Series; classified once at import
+SERIES: Dict[str, Series] = {
+    name: Series(unit, sid, CAT_ID[categorize_item(name)]) for name, (unit, sid) in _RAW_SERIES.items()
+}
+
 # ---- Default "necessities" category weights ----
 # Target conceptual shares (if we also had shelter & healthcare):
 #   shelter 35–40, food-at-home 20–25, utilities/energy 10–15, transport 10–15, healthcare 10
@@ -87,67 +105,50 @@ def get_key() -> str:
         sys.exit("Set FRED_API_KEY in your environment (export FRED_API_KEY=...).")
     return key
 
-def year_avg(series_id: str, year: int, key: str) -> float:
-    params = {
-        "series_id": series_id,
-        "api_key": key,
-        "file_type": "json",
-        "observation_start": f"{year}-01-01",
-        "observation_end": f"{year}-12-31",
-        "frequency": "m",
-        "units": "lin",
-    }
-    r = requests.get(API, params=params, timeout=30)
-    r.raise_for_status()
-    obs = [float(o["value"]) for o in r.json()["observations"] if o["value"] not in ("", ".")]
-    return sum(obs)/len(obs) if obs else float("nan")
-
-def compute_unweighted(rows: List[Tuple[str, float, float]]) -> Tuple[float, float]:
-    """Return (arith_mean_pct_change, geo_mean_relative_minus_1)."""
-    rels = []
-    for _, a, b in rows:
-        if a and b and a > 0 and b > 0:
-            rels.append(b / a)
-    if not rels:
+def year_prices(avgs: Dict[str, Dict[int, float]], sids: List[str], year: int) -> np.ndarray:
+    """One year's price per series, in sids order, as a contiguous float64 array (NaN if missing)."""
+    return np.fromiter((avgs[sid][year] for sid in sids), dtype=np.float64, count=len(sids))
+
+def compute_unweighted(a: np.ndarray, b: np.ndarray) -> Tuple[float, float]:
+    """
+    Return (arith_mean_pct_change, geo_mean_relative_minus_1) for price arrays a -> b.
+    Both must already be filtered to positive prices (main masks out NaN/zero rows).
+    """
+    rels = b / a
+    if not rels.size:
         return (float("nan"), float("nan"))
-    arith = sum((r - 1.0) for r in rels) / len(rels)
-    geo = math.exp(sum(math.log(r) for r in rels) / len(rels)) - 1.0
+    arith = float((rels - 1.0).mean())
+    geo = float(np.expm1(np.log(rels).mean()))
     return arith, geo
 
-def compute_weighted(rows: List[Tuple[str, float, float]],
+def compute_weighted(a: np.ndarray, b: np.ndarray, cat_ids: np.ndarray,
                      cat_weights: Dict[str, float]) -> Tuple[float, Dict[str, float]]:
     """
     Laspeyres-style: equal weight within category; category weights normalized to
-    only the categories present. Returns (weighted_pct_change, normalized_category_weights_used)
+    only the categories present. cat_ids are CAT_ID values aligned with a/b, which must
+    already be filtered to positive prices. Returns (weighted_pct_change, normalized_category_weights_used)
     """
-    # Build per-category lists of relatives
-    by_cat: Dict[str, List[float]] = {}
-    for item, a, b in rows:
-        cat = categorize_item(item)
-        if cat not in cat_weights:  # ignore categories with no weight
-            continue
-        if a and b and a>0 and b>0:
-            by_cat.setdefault(cat, []).append(b/a)
-
-    if not by_cat:
+    # ignore categories with no weight
+    has_weight = np.array([c in cat_weights for c in CATEGORIES], dtype=bool)
+    keep = has_weight[cat_ids]
+    if not keep.any():
         return (float("nan"), {})
 
+    # Per-category item counts and summed pct changes
+    ids = cat_ids[keep]
+    rels = b[keep] / a[keep]
+    counts = np.bincount(ids, minlength=len(CATEGORIES))
+    sums = np.bincount(ids, weights=rels - 1.0, minlength=len(CATEGORIES))
+    present = np.flatnonzero(counts)
+
     # Normalize category weights over the cats present
-    present = [c for c in by_cat.keys()]
-    total_w = sum(cat_weights[c] for c in present)
-    norm_w = {c: (cat_weights[c] / total_w) for c in present}
-
-    # Equal weights within a category
-    weighted = 0.0
-    for c in present:
-        rels = by_cat[c]
-        if not rels:
-            continue
-        within = 1.0 / len(rels)
-        cat_contrib = sum(((r - 1.0) * within) for r in rels)
-        weighted += norm_w[c] * cat_contrib
-
-    return weighted, norm_w
+    w = np.array([cat_weights[CATEGORIES[i]] for i in present], dtype=np.float64)
+    w /= w.sum()
+
+    # Equal weights within a category: mean pct change per category
+    weighted = float(w @ (sums[present] / counts[present]))
+
+    return weighted, {CATEGORIES[i]: float(wi) for i, wi in zip(present, w)}
 
 def purchasing_power_after(pct_change: float) -> Tuple[float, float]:
     if pct_change is None or math.isnan(pct_change):
@@ -155,32 +156,55 @@ def purchasing_power_after(pct_change: float) -> Tuple[float, float]:
     remaining = 1.0 / (1.0 + pct_change)
     return remaining, 1.0 - remaining
 
-def plot_levels(items, base_vals, cmp_vals, year_a, year_b, outfile):
-    plt.figure()
+def top_movers(pct: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices of the k largest (descending) and k smallest (ascending) pct changes.
+    Selects with argpartition and only sorts the k picked, instead of sorting everything.
+    """
+    n = pct.size
+    k = min(k, n)
+    if k == n:
+        top = bottom = np.arange(n)
+    else:
+        top = np.argpartition(pct, n - k)[n - k:]
+        bottom = np.argpartition(pct, k)[:k]
+    return top[np.argsort(-pct[top], kind="stable")], bottom[np.argsort(pct[bottom], kind="stable")]
+
+def _pyplot():
+    """Import matplotlib on first use; it is slow to load and only needed for --plot."""
+    import matplotlib
+    matplotlib.use("Agg")  # headless
+    import matplotlib.pyplot as plt
+    return plt
+
+def plot_levels(fig, items, base_vals, cmp_vals, year_a, year_b, outfile):
+    fig.clf()
+    ax = fig.add_subplot()
     x = range(len(items))
     width = 0.4
-    plt.bar([i - width/2 for i in x], base_vals, width=width, label=str(year_a))
-    plt.bar([i + width/2 for i in x], cmp_vals, width=width, label=str(year_b))
-    plt.xticks(list(x), items, rotation=60, ha="right")
-    plt.ylabel("Price (unit varies)")
-    plt.title(f"Price levels by item: {year_a} vs {year_b}")
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(outfile)
-    plt.close()
-
-def plot_pct_changes(items, pct_changes, outfile):
+    ax.bar([i - width/2 for i in x], base_vals, width=width, label=str(year_a))
+    ax.bar([i + width/2 for i in x], cmp_vals, width=width, label=str(year_b))
+    ax.set_xticks(list(x))
+    ax.set_xticklabels(items, rotation=60, ha="right")
+    ax.set_ylabel("Price (unit varies)")
+    ax.set_title(f"Price levels by item: {year_a} vs {year_b}")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(outfile)
+
+def plot_pct_changes(fig, items, pct_changes, outfile):
     pairs = sorted(zip(items, pct_changes), key=lambda t: t[1], reverse=True)
     items_sorted = [p[0] for p in pairs]
     pct_sorted = [p[1]*100.0 for p in pairs]
-    plt.figure()
-    plt.bar(range(len(items_sorted)), pct_sorted)
-    plt.xticks(range(len(items_sorted)), items_sorted, rotation=60, ha="right")
-    plt.ylabel("% change")
-    plt.title("Percent change by item")
-    plt.tight_layout()
-    plt.savefig(outfile)
-    plt.close()
+    fig.clf()
+    ax = fig.add_subplot()
+    ax.bar(range(len(items_sorted)), pct_sorted)
+    ax.set_xticks(range(len(items_sorted)))
+    ax.set_xticklabels(items_sorted, rotation=60, ha="right")
+    ax.set_ylabel("% change")
+    ax.set_title("Percent change by item")
+    fig.tight_layout()
+    fig.savefig(outfile)
 
 def main():
     ap = argparse.ArgumentParser()
@@ -199,29 +223,40 @@ def main():
 
     key = get_key()
 
-    rows_for_calc: List[Tuple[str, float, float]] = []   # (item, a, b)
-    out_rows = []                                        # for CSV
-    for item,(unit,sid) in SERIES.items():
-        a = year_avg(sid, args.year_a, key)
-        b = year_avg(sid, args.year_b, key)
-        out_rows.append([item, unit,
-                         f"{a:.3f}" if a==a else "",
-                         f"{b:.3f}" if b==b else "",
-                         f"BLS Average Price via FRED ({sid}); annual mean of monthly"])
-        if a==a and b==b and a>0 and b>0:
-            rows_for_calc.append((item, a, b))
-
-    # Write CSV
-    with open(args.out, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["item","unit",f"year_{args.year_a}",f"year_{args.year_b}","source"])
-        w.writerows(out_rows)
+    sids = [s.sid for s in SERIES.values()]
+    try:
+        avgs = fetch_all(sids, [args.year_a, args.year_b], key)
+    except TimeoutError as e:
+        sys.exit(str(e))
+
+    # Prices for every basket item, NaN where FRED had no observation
+    a_all = year_prices(avgs, sids, args.year_a)
+    b_all = year_prices(avgs, sids, args.year_b)
+
+    # Write CSV (NaN -> empty cell)
+    df = pd.DataFrame({
+        "item": list(SERIES),
+        "unit": [s.unit for s in SERIES.values()],
+        "a": a_all,
+        "b": b_all,
+        "source": [f"BLS Average Price via FRED ({sid}); annual mean of monthly" for sid in sids],
+    })
+    df.to_csv(args.out, index=False, float_format="%.3f", na_rep="", lineterminator="\r\n",
+              header=["item", "unit", f"year_{args.year_a}", f"year_{args.year_b}", "source"])
     print(f"Wrote CSV: {args.out}")
 
+    # Items with both prices, as parallel arrays (struct-of-arrays)
+    mask = (a_all > 0) & (b_all > 0)  # NaN compares False
+    names = [item for item, m in zip(SERIES, mask) if m]
+    a_arr = a_all[mask]
+    b_arr = b_all[mask]
+    cat_ids = np.array([s.cat for s in SERIES.values()], dtype=np.intp)[mask]
+    pct = b_arr / a_arr - 1.0
+
     # Compute and print (unweighted)
-    arith, geo = compute_unweighted(rows_for_calc)
+    arith, geo = compute_unweighted(a_arr, b_arr)
     print("\nPERSONAL INFLATION — {} to {}\n".format(args.year_a, args.year_b))
-    print(f"Items used: {len(rows_for_calc)} (of {len(SERIES)})")
+    print(f"Items used: {len(names)} (of {len(SERIES)})")
     print("- Unweighted (arithmetic mean of pct changes): {:6.2f}%".format(arith * 100.0))
     print("- Unweighted (geometric mean of relatives):   {:6.2f}%".format(geo * 100.0))
 
@@ -235,7 +270,7 @@ def main():
             with open(args.weights, "r", encoding="utf-8") as fh:
                 user_w = json.load(fh)
             cat_w.update(user_w)  # user values override defaults
-        weighted_pct, norm_w = compute_weighted(rows_for_calc, cat_w)
+        weighted_pct, norm_w = compute_weighted(a_arr, b_arr, cat_ids, cat_w)
         if weighted_pct == weighted_pct:  # not NaN
             print("\nWEIGHTED 'NECESSITIES' INDEX")
             print("- Weighted pct change: {:6.2f}%".format(weighted_pct * 100.0))
@@ -249,28 +284,27 @@ def main():
             print("\nWeighted index: not computed (no mapped categories present).")
 
     # Top movers
-    pct_changes = [(b/a - 1.0) for (_,a,b) in rows_for_calc]
-    top_increases = sorted(zip([r[0] for r in rows_for_calc], pct_changes), key=lambda t: t[1], reverse=True)[:5]
-    top_decreases = sorted(zip([r[0] for r in rows_for_calc], pct_changes), key=lambda t: t[1])[:5]
+    top_idx, bottom_idx = top_movers(pct, 5)
     print("\nTop item increases:")
-    for name, pct in top_increases:
-        print(f"  {name:40s}  +{pct*100:.1f}%")
+    for i in top_idx:
+        print(f"  {names[i]:40s}  +{pct[i]*100:.1f}%")
     print("\nTop item decreases:")
-    for name, pct in top_decreases:
-        print(f"  {name:40s}  {pct*100:+.1f}%")
+    for i in bottom_idx:
+        print(f"  {names[i]:40s}  {pct[i]*100:+.1f}%")
 
     # Plots
-    if args.plot and rows_for_calc:
-        items = [r[0] for r in rows_for_calc]
-        base_vals = [r[1] for r in rows_for_calc]
-        cmp_vals = [r[2] for r in rows_for_calc]
-        pct = [(r[2]/r[1] - 1.0) for r in rows_for_calc]
-
+    if args.plot and names:
         levels_png = f"levels_{args.year_a}_vs_{args.year_b}.png"
         changes_png = f"pct_changes_{args.year_a}_vs_{args.year_b}.png"
 
-        plot_levels(items, base_vals, cmp_vals, args.year_a, args.year_b, levels_png)
-        plot_pct_changes(items, pct, changes_png)
+        # One figure, cleared and redrawn for each chart
+        plt = _pyplot()
+        fig = plt.figure()
+        try:
+            plot_levels(fig, names, a_arr, b_arr, args.year_a, args.year_b, levels_png)
+            plot_pct_changes(fig, names, pct, changes_png)
+        finally:
+            plt.close(fig)
         print(f"\nSaved charts:\n  {levels_png}\n  {changes_png}")
 
 